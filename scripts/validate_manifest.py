@@ -115,7 +115,8 @@ def extract_function_signatures(main_py_path):
 
     functions = {}
     for node in ast.walk(tree):
-        if isinstance(node, ast.FunctionDef):
+        # async def 的函数同样属于公开接口（如 send_bulk_email_async）
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
             # 只提取模块级别的函数（不在类内部）
             # 检查函数是否在类定义内部
             is_in_class = False
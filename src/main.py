@@ -7,14 +7,720 @@
 📖 完整开发指南请查看：AGENTS.md
 """
 
+from __future__ import annotations
+
+import mmap
 import os
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+import queue
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from html import escape as _escape_html
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, NamedTuple, Tuple
+
+# smtplib / email / concurrent.futures 导入开销大（冷启动约 40ms），
+# 放到真正走 SMTP 路径的函数内部按需导入，
+# 短生命周期调用方（serverless / Gateway worker）只为用到的部分付费
+if TYPE_CHECKING:
+    import smtplib
+    from email.message import EmailMessage
+    from email.mime.base import MIMEBase
+
+# v3.0: 附件文件路径（Gateway 会自动下载文件到该目录）
+ATTACHMENTS_DIR = Path("data/inputs/attachments")
+
+# 参数校验表：字段名 -> (错误信息, 错误码)
+_FIELD_TO_CODE = {
+    "to": ("收件人地址 (to) 必须是非空字符串", "INVALID_RECIPIENT"),
+    "subject": ("邮件主题 (subject) 必须是非空字符串", "INVALID_SUBJECT"),
+    "body": ("邮件正文 (body) 必须是非空字符串", "INVALID_BODY"),
+}
+
+
+def _require_nonempty_str(**kwargs: Any) -> Optional[Dict[str, Any]]:
+    """
+    校验关键字参数均为非空字符串
+
+    按传入顺序检查，返回第一个不合法字段对应的错误字典；全部合法返回 None。
+    """
+    for field, value in kwargs.items():
+        if not value or not isinstance(value, str):
+            error, code = _FIELD_TO_CODE[field]
+            return {
+                "success": False,
+                "error": error,
+                "error_code": code
+            }
+    return None
+
+
+# 宽松的邮箱地址合法性检查（local@domain.tld，不含空白）
+_ADDR_RE = re.compile(r'^[^\s@]+@[^\s@]+\.[^\s@]+$')
+
+
+# 预编译的地址分隔正则：切分和去空白在一次 C 层扫描里完成
+_ADDR_SPLIT = re.compile(r'\s*,\s*')
+
+
+def _parse_addrs(s: Optional[str]) -> List[str]:
+    """
+    解析逗号分隔的地址字符串
+
+    预编译的正则同时吃掉分隔符两侧的空白，免去逐项 strip 的第二趟
+    Python 循环；None / 空串返回空列表，空项（连续逗号）被过滤。
+    """
+    if not s:
+        return []
+    return [addr for addr in _ADDR_SPLIT.split(s.strip()) if addr]
+
+
+class _AttachmentError(Exception):
+    """附件处理失败（内部使用，携带出错的文件名）"""
+
+    def __init__(self, file_name: str, cause: Exception):
+        super().__init__(f"{file_name}: {cause}")
+        self.file_name = file_name
+
+
+# base64 按 57 字节编码为一行 76 字符，取 57 的整数倍保证分块编码后行对齐
+_B64_CHUNK_SIZE = 57 * 1024
+
+
+def _encode_attachment(file_path: Path) -> MIMEBase:
+    """
+    把单个文件编码为 base64 附件
+
+    通过 mmap 映射文件并分块喂给 base64 编码器，内核按需换入页面，
+    峰值内存从「文件 + 1.33 倍 base64 展开」降到单个分块大小。
+    payload 直接以已编码形式写入，跳过 encoders.encode_base64 的整体二次遍历。
+    """
+    import base64
+    from email.mime.base import MIMEBase
+
+    part = MIMEBase('application', 'octet-stream')
+
+    encoded = bytearray()
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    # 提示内核顺序预读 + 预取，降低缺页延迟
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                    mm.madvise(mmap.MADV_WILLNEED)
+                # memoryview 切片不复制数据，编码器直接消费映射页
+                view = memoryview(mm)
+                try:
+                    for offset in range(0, size, _B64_CHUNK_SIZE):
+                        encoded += base64.encodebytes(view[offset:offset + _B64_CHUNK_SIZE])
+                finally:
+                    view.release()
+
+    part.set_payload(encoded.decode('ascii'))
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header(
+        'Content-Disposition',
+        f'attachment; filename={file_path.name}'
+    )
+    return part
+
+
+class SmtpConfigError(Exception):
+    """SMTP 环境变量配置缺失或非法，携带对应的错误字典"""
+
+    def __init__(self, error: Dict[str, Any]):
+        super().__init__(error["error"])
+        self.error = error
+
+
+@dataclass(frozen=True)
+class SmtpConfig:
+    """解析后的 SMTP 连接配置"""
+
+    host: str
+    port: int
+    username: str
+    password: str
+    use_tls: bool
+
+
+@lru_cache(maxsize=4)
+def _load_smtp_config(
+    smtp_host: Optional[str],
+    smtp_port: Optional[str],
+    smtp_username: Optional[str],
+    smtp_password: Optional[str],
+    smtp_use_tls: bool
+) -> SmtpConfig:
+    """
+    校验并解析 SMTP 配置（按环境变量快照缓存）
+
+    缓存键就是五个环境变量的当前取值：环境不变时命中缓存，
+    省掉重复的校验和端口解析；环境变了自然产生新键，
+    不存在读到旧配置的问题，测试也无需手动清缓存。
+
+    Raises:
+        SmtpConfigError: 配置缺失或端口非法
+    """
+    missing_configs = []
+    if not smtp_host:
+        missing_configs.append('SMTP_HOST')
+    if not smtp_port:
+        missing_configs.append('SMTP_PORT')
+    if not smtp_username:
+        missing_configs.append('SMTP_USERNAME')
+    if not smtp_password:
+        missing_configs.append('SMTP_PASSWORD')
+
+    if missing_configs:
+        raise SmtpConfigError({
+            "success": False,
+            "error": f"缺少必需的 SMTP 配置: {', '.join(missing_configs)}",
+            "error_code": "MISSING_SMTP_CONFIG",
+            "missing_configs": missing_configs
+        })
+
+    try:
+        port = int(smtp_port)
+    except ValueError:
+        raise SmtpConfigError({
+            "success": False,
+            "error": f"SMTP_PORT 必须是数字: {smtp_port}",
+            "error_code": "INVALID_PORT"
+        })
+
+    return SmtpConfig(
+        host=smtp_host,
+        port=port,
+        username=smtp_username,
+        password=smtp_password,
+        use_tls=smtp_use_tls
+    )
+
+
+def _smtp_config() -> SmtpConfig:
+    """从环境变量读取 SMTP 配置，解析结果按取值快照缓存"""
+    return _load_smtp_config(
+        os.environ.get('SMTP_HOST'),
+        os.environ.get('SMTP_PORT'),
+        os.environ.get('SMTP_USERNAME'),
+        os.environ.get('SMTP_PASSWORD'),
+        os.environ.get('SMTP_USE_TLS', 'true').lower() == 'true'
+    )
+
+
+def _io_uring_enabled() -> bool:
+    """是否启用 io_uring 发送路径（环境开关 + 可选依赖 liburing）"""
+    return os.environ.get('SMTP_IO_URING', '').lower() == 'true'
+
+
+class _IoUringSocket:
+    """
+    通过 io_uring 提交写出的套接字包装（Linux 专用，按需启用）
+
+    sendall 把整块数据作为单个 SQE 提交（io_uring_prep_send），
+    大 MIME 正文从多次 write 系统调用合并为一次 io_uring_enter；
+    读路径和其余属性原样透传给被包装的套接字。
+    """
+
+    def __init__(self, sock):
+        import liburing
+
+        self._liburing = liburing
+        self._sock = sock
+        self._ring = liburing.io_uring()
+        liburing.io_uring_queue_init(8, self._ring)
+
+    def sendall(self, data):
+        liburing = self._liburing
+        view = memoryview(bytes(data))
+        while view:
+            sqe = liburing.io_uring_get_sqe(self._ring)
+            liburing.io_uring_prep_send(sqe, self._sock.fileno(), view, len(view), 0)
+            liburing.io_uring_submit(self._ring)
+            cqe = liburing.io_uring_cqe()
+            liburing.io_uring_wait_cqe(self._ring, cqe)
+            sent = cqe.res
+            liburing.io_uring_cqe_seen(self._ring, cqe)
+            if sent <= 0:
+                raise OSError(-sent, "io_uring send 失败")
+            view = view[sent:]
+
+    def close(self):
+        try:
+            self._liburing.io_uring_queue_exit(self._ring)
+        finally:
+            self._sock.close()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+def _maybe_wrap_io_uring(server: Any) -> None:
+    """环境开关打开且 liburing 可用时，把连接的发送路径换成 io_uring"""
+    if not _io_uring_enabled():
+        return
+    try:
+        import liburing  # noqa: F401
+    except ImportError:
+        # 未安装可选依赖：静默回退到普通阻塞套接字
+        return
+    server.sock = _IoUringSocket(server.sock)
+
+
+def _connect_smtp(config: SmtpConfig) -> smtplib.SMTP:
+    """
+    连接并登录 SMTP 服务器
+
+    根据配置建立 TLS 或 SSL 连接并完成认证。
+    连接或认证失败时抛出 smtplib 的相应异常，由调用方转换为错误字典。
+
+    Args:
+        config: _smtp_config 返回的配置
+
+    Returns:
+        已完成登录的 SMTP 连接对象
+    """
+    import smtplib
+    import socket
+
+    if config.use_tls:
+        # 使用 TLS
+        server = smtplib.SMTP(config.host, config.port)
+        server.starttls()
+    else:
+        # 使用 SSL
+        server = smtplib.SMTP_SSL(config.host, config.port)
+
+    # 关闭 Nagle（避免信封小包攒批的约 40ms 延迟），并放大发送缓冲，
+    # 让带附件的大 MIME 一次写入不被内核写节流
+    sock = getattr(server, 'sock', None)
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        except OSError:
+            pass
+
+    server.login(config.username, config.password)
+    _maybe_wrap_io_uring(server)
+    return server
+
+
+@contextmanager
+def _smtp_session(config: SmtpConfig):
+    """
+    SMTP 连接的上下文管理器
+
+    正常退出时 quit()（完成 QUIT/221 握手礼貌关闭）；异常退出时直接
+    close() 丢弃套接字，跳过 QUIT 的往返等待。
+    """
+    server = _connect_smtp(config)
+    try:
+        yield server
+    except Exception:
+        try:
+            server.close()
+        except Exception:
+            pass
+        raise
+    try:
+        server.quit()
+    except Exception:
+        pass
+
+
+# 附件编码结果缓存：路径 -> ((mtime, size), 已编码的 MIME part)
+_attachment_parts_cache: Dict[Path, Tuple[Tuple[float, int], MIMEBase]] = {}
+
+# 附件目录扫描缓存：目录 mtime 不变时直接复用上次的文件列表
+_attach_dir_cache: Dict[str, Any] = {"mtime": None, "files": []}
+
+
+def _scan_attachment_files() -> List[Path]:
+    """
+    列出附件目录下的文件
+
+    单次 os.scandir 代替 exists() + glob + 逐项 stat 的组合；
+    目录 mtime 未变化时直接返回缓存列表，目录不存在时 O(1) 返回空。
+    无附件的批量发送（最常见情况）因此不再对每个收件人做一轮 stat。
+    """
+    try:
+        st = os.stat(ATTACHMENTS_DIR)
+    except FileNotFoundError:
+        return []
+
+    if st.st_mtime == _attach_dir_cache["mtime"]:
+        return _attach_dir_cache["files"]
+
+    with os.scandir(ATTACHMENTS_DIR) as it:
+        # scandir 的目录项自带 stat 信息，过滤目录不产生额外系统调用
+        files = [Path(entry.path) for entry in it if entry.is_file(follow_symlinks=False)]
+
+    _attach_dir_cache["mtime"] = st.st_mtime
+    _attach_dir_cache["files"] = files
+    return files
+
+
+def _build_attachment_parts() -> List[MIMEBase]:
+    """
+    扫描附件目录并编码为 MIME part 列表
+
+    每个文件只 glob / 读取 / 编码一次，按 (mtime, size) 记忆化，
+    同一进程内的重复批量发送可以完全跳过磁盘读取和 base64 编码。
+    编码后的 part 可以安全地挂到多个 MIMEMultipart 上
+    （生成器在序列化时才重新输出头部和 payload）。
+
+    附件读取或编码失败时抛出 _AttachmentError。
+    """
+    parts = []
+    for file_path in _scan_attachment_files():
+        try:
+            st = file_path.stat()
+            fingerprint = (st.st_mtime, st.st_size)
+            cached = _attachment_parts_cache.get(file_path)
+            if cached is not None and cached[0] == fingerprint:
+                parts.append(cached[1])
+            else:
+                part = _encode_attachment(file_path)
+                _attachment_parts_cache[file_path] = (fingerprint, part)
+                parts.append(part)
+        except _AttachmentError:
+            raise
+        except Exception as e:
+            raise _AttachmentError(file_path.name, e)
+
+    return parts
+
+
+@lru_cache(maxsize=1)
+def _static_boundary() -> str:
+    """
+    进程级固定的 MIME boundary
+
+    EmailMessage 默认每次序列化时各自抽熵生成 boundary；
+    四处复用同一个带随机后缀的值即可（每个 DATA 流相互独立），
+    批量发送不再逐封走随机数生成。
+    """
+    import secrets
+    return "=_EMAILPREFAB_" + secrets.token_hex(8)
+
+
+def _build_message(
+    from_addr: str,
+    to: Optional[str],
+    subject: str,
+    body: str,
+    body_type: str,
+    cc: Optional[str] = None,
+    attachments: Optional[List[MIMEBase]] = None
+) -> EmailMessage:
+    """
+    构建邮件对象（正文 + data/inputs/attachments/ 下的附件）
+
+    使用现代的 email.message.EmailMessage API（email.policy.default），
+    头部折叠走 C 加速路径，比旧的 email.mime.* 栈少分配若干中间对象。
+
+    Args:
+        to: 收件人头；传 None 时不写 To 头（批量发送预序列化后
+            在字节层面逐封补上）
+        attachments: 预先编码好的附件 part 列表；传 None 时自动扫描附件目录。
+            批量发送时只构建一次再逐封复用。
+
+    附件读取或编码失败时抛出 _AttachmentError。
+    """
+    from email.message import EmailMessage
+
+    msg = EmailMessage()
+    msg['From'] = from_addr
+    if to:
+        msg['To'] = to
+    msg['Subject'] = subject
+
+    if cc:
+        msg['Cc'] = cc
+
+    # 添加邮件正文
+    msg.set_content(body, subtype=body_type, charset='utf-8')
+
+    # v3.0: 添加附件（自动扫描 data/inputs/attachments/ 目录）
+    # 附件 part 是提前 base64 编码好的（可跨多封邮件复用），
+    # 因此转成 multipart/mixed 后直接挂载，而不走 add_attachment 的重编码
+    if attachments is None:
+        attachments = _build_attachment_parts()
+    if attachments:
+        msg.make_mixed()
+        msg.set_boundary(_static_boundary())
+        for part in attachments:
+            msg.attach(part)
+
+    return msg
+
+
+class SendResult(NamedTuple):
+    """
+    单封邮件的发送结果
+
+    批量发送路径内部只累积这个轻量元组，出口处再一次性转换为
+    对外约定的结果字典，省掉每封邮件一次中间字典分配。
+    """
+    recipient: str
+    success: bool
+    error: Optional[str] = None
+    code: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """转换为对外返回的结果字典"""
+        return {
+            "recipient": self.recipient,
+            "success": self.success,
+            "error": self.error,
+            "error_code": self.code
+        }
+
+
+def _bulk_summary(results: List[SendResult]) -> Dict[str, Any]:
+    """
+    汇总批量发送结果
+
+    除逐条的 results 外附带 failed_recipients（收件人 -> 错误码），
+    调用方检查某个地址是否失败时 O(1) 查字典，不必再扫结果列表。
+    """
+    failed = sum(1 for r in results if not r.success)
+    return {
+        "success": failed == 0,
+        "total": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "failed_recipients": {r.recipient: r.code for r in results if not r.success},
+        "results": [r.as_dict() for r in results]
+    }
+
+
+def _normalize_recipients(
+    recipients: List[str]
+) -> Tuple[List[Optional[SendResult]], Dict[str, List[int]]]:
+    """
+    一次遍历完成地址清洗：strip、域名小写、正则校验、保序去重
+
+    重复地址只发送一次，非法地址直接记为失败，不浪费 SMTP 往返。
+
+    Returns:
+        (与 recipients 等长的结果槽位列表，非法地址已就位,
+         规范化地址 -> 原始下标列表)
+    """
+    results: List[Optional[SendResult]] = [None] * len(recipients)
+    unique: Dict[str, List[int]] = {}
+    for index, recipient in enumerate(recipients):
+        addr = recipient.strip() if isinstance(recipient, str) else ""
+        local, sep, domain = addr.rpartition('@')
+        if sep:
+            addr = f"{local}@{domain.lower()}"
+        if _ADDR_RE.match(addr):
+            unique.setdefault(addr, []).append(index)
+        else:
+            results[index] = SendResult(
+                recipient=recipient,
+                success=False,
+                error=f"无效的邮箱地址: {recipient}",
+                code="INVALID_ADDRESS"
+            )
+    return results, unique
+
+
+# 收件人数量达到该阈值时自动启用并行发送
+_PARALLEL_THRESHOLD = 20
+
+
+def _send_bulk_parallel(
+    config: SmtpConfig,
+    recipients: List[str],
+    base_bytes: bytes,
+    max_workers: int,
+    pool_size: int
+) -> List[SendResult]:
+    """
+    通过线程池 + SMTP 连接池并行发送批量邮件
+
+    预先建立 pool_size 个已认证的 SMTP 连接放入队列，每个发送任务
+    从队列借出一个连接，发送完毕后归还。SMTP 发送是网络 I/O 密集型，
+    套接字读写期间会释放 GIL，因此线程数在服务商并发上限内近似线性扩展。
+    邮件内容是预先序列化好的 base_bytes（不含 To 头），
+    每封只在字节层面补上收件人头。
+
+    Returns:
+        与 recipients 顺序一致的 SendResult 列表
+
+    Raises:
+        smtplib 的连接 / 认证异常（建立连接池阶段），由调用方转换为错误字典
+    """
+    import smtplib
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    pool_size = min(pool_size, len(recipients))
+    pool: "queue.Queue[smtplib.SMTP]" = queue.Queue()
+
+    connections = []
+    try:
+        for _ in range(pool_size):
+            server = _connect_smtp(config)
+            connections.append(server)
+            pool.put(server)
+
+        def _send_one(recipient: str) -> Optional[Tuple[str, str]]:
+            """发送一封邮件，返回 None 或 (error, error_code)"""
+            server = pool.get()
+            try:
+                addr = recipient.strip()
+                raw = _patch_to_header(base_bytes, addr)
+                try:
+                    server.sendmail(config.username, [addr], raw)
+                except smtplib.SMTPServerDisconnected:
+                    # 连接失效：close() 丢弃后换一个新连接重试一次
+                    server.close()
+                    try:
+                        server = _connect_smtp(config)
+                    except Exception as e:
+                        # 重连失败只算这一位收件人失败，不能让异常
+                        # 逃出线程把整个批次的结果作废
+                        return (f"连接 SMTP 服务器失败: {str(e)}", "SMTP_CONNECTION_ERROR")
+                    connections.append(server)
+                    server.sendmail(config.username, [addr], raw)
+                return None
+            except smtplib.SMTPRecipientsRefused as e:
+                return (f"收件人被拒绝: {str(e)}", "SMTP_ERROR")
+            except smtplib.SMTPException as e:
+                return (f"SMTP 错误: {str(e)}", "SMTP_ERROR")
+            finally:
+                pool.put(server)
+
+        results: List[Optional[SendResult]] = [None] * len(recipients)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_send_one, recipient): index
+                for index, recipient in enumerate(recipients)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                error_info = future.result()
+                results[index] = SendResult(
+                    recipient=recipients[index],
+                    success=error_info is None,
+                    error=error_info[0] if error_info else None,
+                    code=error_info[1] if error_info else None
+                )
+
+        return results
+
+    finally:
+        for server in connections:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+
+def _render_fixed(msg: EmailMessage) -> bytes:
+    """
+    把邮件一次性序列化为线上字节（BytesGenerator + SMTP 策略）
+
+    policy.SMTP 直接产出 CRLF 行尾的线上格式，sendmail 不用再对
+    每封邮件做行尾规范化；头部折行 / 编码这类 Python 级工作
+    整个批次只发生一次。
+    """
+    from email import policy
+    from email.generator import BytesGenerator
+    from io import BytesIO
+
+    buf = BytesIO()
+    BytesGenerator(buf, policy=policy.SMTP).flatten(msg)
+    return buf.getvalue()
+
+
+def _patch_to_header(base_bytes: bytes, recipient: str) -> bytes:
+    """在预序列化的邮件字节前补上 To 头"""
+    return b"To: " + recipient.encode('utf-8') + b"\r\n" + base_bytes
+
+
+def _supports_pipelining(server: Any) -> bool:
+    """连接是否通过 EHLO 声明了 ESMTP PIPELINING 扩展"""
+    feats = getattr(server, 'esmtp_features', None)
+    return isinstance(feats, dict) and 'pipelining' in feats
+
+
+def _pipeline_send(
+    server: Any,
+    sender: str,
+    msgs: List[Tuple[str, bytes]]
+) -> List[Optional[Tuple[str, str]]]:
+    """
+    利用 ESMTP PIPELINING（RFC 2920）合并信封命令的往返
+
+    每封邮件把 MAIL FROM / RCPT TO / DATA 三条命令拼成一次 socket
+    写出（DATA 必须是流水线组里的最后一条命令），随后统一读取三条
+    响应，把 sendmail 逐条命令等待的 3 次往返压缩为 1 次；
+    正文仍按协议在收到 354 之后单独写出。
+
+    Args:
+        server: 已登录且声明了 PIPELINING 的 SMTP 连接
+        sender: 信封发件人地址
+        msgs: (收件人, 预序列化邮件字节) 列表
+
+    Returns:
+        与 msgs 顺序一致的列表，每项为 None（成功）或 (error, error_code)。
+        连接中途失效时当前邮件记为失败并提前返回（列表短于 msgs），
+        由调用方重连后继续处理剩余收件人。
+    """
+    import smtplib
+
+    results: List[Optional[Tuple[str, str]]] = []
+    for addr, raw in msgs:
+        try:
+            envelope = (
+                f"mail FROM:<{sender}>\r\n"
+                f"rcpt TO:<{addr}>\r\n"
+                "data\r\n"
+            ).encode('ascii')
+            server.sock.sendall(envelope)
+            mail_code, _ = server.getreply()
+            rcpt_code, rcpt_msg = server.getreply()
+            data_code, _ = server.getreply()
+
+            if data_code != 354:
+                # 信封阶段被拒：服务器不会进入 DATA 状态，连接仍可继续
+                if rcpt_code not in (250, 251):
+                    results.append((f"收件人被拒绝: {rcpt_msg.decode('utf-8', 'replace')}", "SMTP_ERROR"))
+                else:
+                    results.append((f"SMTP 错误: mail={mail_code} data={data_code}", "SMTP_ERROR"))
+                continue
+
+            # 点号转义（RFC 5321 4.5.2）并以 <CRLF>.<CRLF> 结束正文
+            data = re.sub(br'(?m)^\.', b'..', raw)
+            if not data.endswith(b"\r\n"):
+                data += b"\r\n"
+            server.sock.sendall(data + b".\r\n")
+            code, msg = server.getreply()
+            if code == 250:
+                results.append(None)
+            else:
+                results.append((f"SMTP 错误: {msg.decode('utf-8', 'replace')}", "SMTP_ERROR"))
+        except (OSError, smtplib.SMTPException) as e:
+            # 连接层故障：当前邮件记为失败，交由调用方重连后继续
+            results.append((f"SMTP 连接已断开: {str(e)}", "SMTP_ERROR"))
+            break
+    return results
+
+
+def _send(
+    server: smtplib.SMTP,
+    msg: EmailMessage,
+    from_addr: str,
+    recipients: List[str]
+) -> None:
+    """通过已建立的连接发送一封邮件"""
+    server.send_message(msg, from_addr=from_addr, to_addrs=recipients)
 
 
 def send_email(
@@ -54,56 +760,17 @@ def send_email(
         ... )
         {'success': True, 'message': '邮件发送成功', 'recipients': ['user@example.com']}
     """
-    # v3.0: 附件文件路径
-    ATTACHMENTS_DIR = Path("data/inputs/attachments")
     try:
         # 获取 SMTP 配置（从环境变量）
-        smtp_host = os.environ.get('SMTP_HOST')
-        smtp_port = os.environ.get('SMTP_PORT')
-        smtp_username = os.environ.get('SMTP_USERNAME')
-        smtp_password = os.environ.get('SMTP_PASSWORD')
-        smtp_use_tls = os.environ.get('SMTP_USE_TLS', 'true').lower() == 'true'
-
-        # 验证必需的配置
-        missing_configs = []
-        if not smtp_host:
-            missing_configs.append('SMTP_HOST')
-        if not smtp_port:
-            missing_configs.append('SMTP_PORT')
-        if not smtp_username:
-            missing_configs.append('SMTP_USERNAME')
-        if not smtp_password:
-            missing_configs.append('SMTP_PASSWORD')
-
-        if missing_configs:
-            return {
-                "success": False,
-                "error": f"缺少必需的 SMTP 配置: {', '.join(missing_configs)}",
-                "error_code": "MISSING_SMTP_CONFIG",
-                "missing_configs": missing_configs
-            }
+        try:
+            config = _smtp_config()
+        except SmtpConfigError as e:
+            return e.error
 
         # 验证参数
-        if not to or not isinstance(to, str):
-            return {
-                "success": False,
-                "error": "收件人地址 (to) 必须是非空字符串",
-                "error_code": "INVALID_RECIPIENT"
-            }
-
-        if not subject or not isinstance(subject, str):
-            return {
-                "success": False,
-                "error": "邮件主题 (subject) 必须是非空字符串",
-                "error_code": "INVALID_SUBJECT"
-            }
-
-        if not body or not isinstance(body, str):
-            return {
-                "success": False,
-                "error": "邮件正文 (body) 必须是非空字符串",
-                "error_code": "INVALID_BODY"
-            }
+        err = _require_nonempty_str(to=to, subject=subject, body=body)
+        if err:
+            return err
 
         if body_type not in ["plain", "html"]:
             return {
@@ -112,73 +779,38 @@ def send_email(
                 "error_code": "INVALID_BODY_TYPE"
             }
 
-        # 解析收件人地址
-        to_addresses = [addr.strip() for addr in to.split(',')]
-        cc_addresses = [addr.strip() for addr in cc.split(',')] if cc else []
-        bcc_addresses = [addr.strip() for addr in bcc.split(',')] if bcc else []
-
-        # 创建邮件对象
-        msg = MIMEMultipart()
-        msg['From'] = smtp_username
-        msg['To'] = to
-        msg['Subject'] = subject
-
-        if cc:
-            msg['Cc'] = cc
-
-        # 添加邮件正文
-        msg.attach(MIMEText(body, body_type, 'utf-8'))
+        # 校验通过后才引入 smtplib：纯校验失败的调用不加载重模块
+        import smtplib
 
-        # v3.0: 添加附件（自动扫描 data/inputs/attachments/ 目录）
-        if ATTACHMENTS_DIR.exists():
-            attachment_files = list(ATTACHMENTS_DIR.glob("*"))
-            # 过滤掉目录，只保留文件
-            attachment_files = [f for f in attachment_files if f.is_file()]
+        # 解析收件人地址（单地址走快速路径）
+        to_addresses = _parse_addrs(to)
+        cc_addresses = _parse_addrs(cc)
+        bcc_addresses = _parse_addrs(bcc)
 
-            for file_path in attachment_files:
-                try:
-                    with open(file_path, 'rb') as f:
-                        part = MIMEBase('application', 'octet-stream')
-                        part.set_payload(f.read())
-                        encoders.encode_base64(part)
-                        part.add_header(
-                            'Content-Disposition',
-                            f'attachment; filename={file_path.name}'
-                        )
-                        msg.attach(part)
-
-                except Exception as e:
-                    return {
-                        "success": False,
-                        "error": f"处理附件失败 ({file_path.name}): {str(e)}",
-                        "error_code": "ATTACHMENT_ERROR"
-                    }
-
-        # 连接 SMTP 服务器并发送邮件
+        # 创建邮件对象（附件自动从 data/inputs/attachments/ 读取）
         try:
-            port = int(smtp_port)
-        except ValueError:
+            msg = _build_message(
+                from_addr=config.username,
+                to=to,
+                subject=subject,
+                body=body,
+                body_type=body_type,
+                cc=cc
+            )
+        except _AttachmentError as e:
             return {
                 "success": False,
-                "error": f"SMTP_PORT 必须是数字: {smtp_port}",
-                "error_code": "INVALID_PORT"
+                "error": f"处理附件失败 ({e.file_name}): {str(e)}",
+                "error_code": "ATTACHMENT_ERROR"
             }
 
         # 所有收件人（包括抄送和密送）
         all_recipients = to_addresses + cc_addresses + bcc_addresses
 
+        # 连接 SMTP 服务器并发送邮件
         try:
-            if smtp_use_tls:
-                # 使用 TLS
-                server = smtplib.SMTP(smtp_host, port)
-                server.starttls()
-            else:
-                # 使用 SSL
-                server = smtplib.SMTP_SSL(smtp_host, port)
-
-            server.login(smtp_username, smtp_password)
-            server.send_message(msg, from_addr=smtp_username, to_addrs=all_recipients)
-            server.quit()
+            with _smtp_session(config) as server:
+                _send(server, msg, config.username, all_recipients)
 
             return {
                 "success": True,
@@ -219,19 +851,28 @@ def send_bulk_email(
     recipients: List[str],
     subject: str,
     body: str,
-    body_type: str = "plain"
+    body_type: str = "plain",
+    max_per_connection: int = 500,
+    max_workers: int = 15,
+    pool_size: int = 15
 ) -> Dict[str, Any]:
     """
     批量发送邮件
 
     向多个收件人分别发送相同内容的邮件。
+    整个批次复用 SMTP 连接（只建立一次 TCP/TLS 连接并认证一次），
     每封邮件独立发送，失败的邮件不会影响其他邮件。
+    收件人数量达到 20 时自动切换为线程池 + 连接池并行发送。
 
     Args:
         recipients: 收件人邮箱地址列表
         subject: 邮件主题
         body: 邮件正文内容
         body_type: 邮件正文类型，"plain" 或 "html"，默认 "plain"
+        max_per_connection: 单个连接最多发送的邮件数，默认 500，
+            达到后重建连接（服务商普遍限制单连接消息数，仅串行模式生效）
+        max_workers: 并行模式下的工作线程数，默认 15
+        pool_size: 并行模式下的 SMTP 连接池大小，默认 15
 
     Returns:
         包含批量发送结果的字典
@@ -259,53 +900,423 @@ def send_bulk_email(
                 "error_code": "INVALID_RECIPIENTS"
             }
 
-        if not subject or not isinstance(subject, str):
+        err = _require_nonempty_str(subject=subject, body=body)
+        if err:
+            return err
+
+        if body_type not in ["plain", "html"]:
             return {
                 "success": False,
-                "error": "邮件主题 (subject) 必须是非空字符串",
-                "error_code": "INVALID_SUBJECT"
+                "error": "body_type 必须是 'plain' 或 'html'",
+                "error_code": "INVALID_BODY_TYPE"
             }
 
-        if not body or not isinstance(body, str):
+        # 获取 SMTP 配置（从环境变量）
+        try:
+            config = _smtp_config()
+        except SmtpConfigError as e:
+            return e.error
+
+        # 校验通过后才引入 smtplib：纯校验失败的调用不加载重模块
+        import smtplib
+
+        # 附件只扫描 / 编码一次，整个批次逐封复用
+        try:
+            attachment_parts = _build_attachment_parts()
+        except _AttachmentError as e:
             return {
                 "success": False,
-                "error": "邮件正文 (body) 必须是非空字符串",
-                "error_code": "INVALID_BODY"
+                "error": f"处理附件失败 ({e.file_name}): {str(e)}",
+                "error_code": "ATTACHMENT_ERROR"
             }
 
-        # 逐个发送邮件
-        results = []
-        succeeded = 0
-        failed = 0
+        # 地址清洗与去重（与异步路径共用同一套规则）
+        results, unique = _normalize_recipients(recipients)
 
-        for recipient in recipients:
-            result = send_email(
-                to=recipient,
-                subject=subject,
-                body=body,
-                body_type=body_type
-            )
+        send_list = list(unique)
+        if not send_list:
+            return _bulk_summary(results)
 
-            if result["success"]:
-                succeeded += 1
-            else:
-                failed += 1
+        # 整个批次只构建、序列化一次 MIME（省掉 N-1 次附件 base64 重编码），
+        # 每封邮件仅在字节层面补上 To 头
+        base_msg = _build_message(
+            from_addr=config.username,
+            to=None,
+            subject=subject,
+            body=body,
+            body_type=body_type,
+            attachments=attachment_parts
+        )
+        base_bytes = _render_fixed(base_msg)
+
+        # 大批量时并行发送（线程池 + SMTP 连接池）
+        if len(send_list) >= _PARALLEL_THRESHOLD and max_workers > 1:
+            try:
+                sent_results = _send_bulk_parallel(
+                    config, send_list, base_bytes,
+                    max_workers=max_workers, pool_size=pool_size
+                )
+            except smtplib.SMTPAuthenticationError:
+                return {
+                    "success": False,
+                    "error": "SMTP 认证失败，请检查用户名和密码",
+                    "error_code": "SMTP_AUTH_ERROR"
+                }
+            except Exception as e:
+                return {
+                    "success": False,
+                    "error": f"连接 SMTP 服务器失败: {str(e)}",
+                    "error_code": "SMTP_CONNECTION_ERROR"
+                }
+
+            for addr, sent in zip(send_list, sent_results):
+                for index in unique[addr]:
+                    results[index] = sent._replace(recipient=recipients[index])
+
+            return _bulk_summary(results)
+
+        # 建立一次连接，整个批次复用
+        try:
+            server = _connect_smtp(config)
+        except smtplib.SMTPAuthenticationError:
+            return {
+                "success": False,
+                "error": "SMTP 认证失败，请检查用户名和密码",
+                "error_code": "SMTP_AUTH_ERROR"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"连接 SMTP 服务器失败: {str(e)}",
+                "error_code": "SMTP_CONNECTION_ERROR"
+            }
 
-            results.append({
-                "recipient": recipient,
-                "success": result["success"],
-                "error": result.get("error"),
-                "error_code": result.get("error_code")
-            })
+        # 服务器声明 PIPELINING 且批次无需轮换连接时，
+        # 走流水线路径合并信封命令的往返
+        if _supports_pipelining(server) and len(send_list) <= max_per_connection:
+            sent: List[Optional[Tuple[str, str]]] = []
+            try:
+                while len(sent) < len(send_list):
+                    remaining = send_list[len(sent):]
+                    batch = _pipeline_send(
+                        server, config.username,
+                        [(addr, _patch_to_header(base_bytes, addr)) for addr in remaining]
+                    )
+                    sent.extend(batch)
+                    if len(sent) >= len(send_list):
+                        break
+
+                    # 连接中途失效：丢弃旧连接，重连后继续发剩余收件人
+                    try:
+                        server.close()
+                    except Exception:
+                        pass
+                    try:
+                        server = _connect_smtp(config)
+                    except Exception as e:
+                        # 重连失败：剩余收件人统一记为连接错误
+                        sent.extend(
+                            [(f"连接 SMTP 服务器失败: {str(e)}", "SMTP_CONNECTION_ERROR")]
+                            * (len(send_list) - len(sent))
+                        )
+                        break
+                    if not _supports_pipelining(server):
+                        # 新连接不再声明 PIPELINING：剩余部分退回逐封 sendmail
+                        for addr in send_list[len(sent):]:
+                            try:
+                                server.sendmail(
+                                    config.username, [addr],
+                                    _patch_to_header(base_bytes, addr)
+                                )
+                                sent.append(None)
+                            except smtplib.SMTPException as e:
+                                sent.append((f"SMTP 错误: {str(e)}", "SMTP_ERROR"))
+                        break
+            finally:
+                try:
+                    server.quit()
+                except Exception:
+                    pass
+
+            for addr, error_info in zip(send_list, sent):
+                for index in unique[addr]:
+                    results[index] = SendResult(
+                        recipient=recipients[index],
+                        success=error_info is None,
+                        error=error_info[0] if error_info else None,
+                        code=error_info[1] if error_info else None
+                    )
+
+            return _bulk_summary(results)
+
+        # 逐个发送邮件（只有邮件头变化，失败不影响后续发送）
+        sent_on_conn = 0
+        # 每发送 max_per_connection//4 封做一次 noop 探活
+        noop_every = max(1, max_per_connection // 4) if max_per_connection else 0
+
+        # 重连（轮换 / 探活 / 断开恢复）失败时记下错误，
+        # 剩余收件人标记为连接错误后带着已有结果返回
+        conn_error: Optional[str] = None
+        try:
+            for pos, addr in enumerate(send_list):
+                error_info = None
+                try:
+                    # 定期重建连接（规避单连接消息数上限）
+                    if max_per_connection and sent_on_conn >= max_per_connection:
+                        server.quit()
+                        server = _connect_smtp(config)
+                        sent_on_conn = 0
+                    elif noop_every and sent_on_conn and sent_on_conn % noop_every == 0:
+                        # noop 探活：连接已被服务器断开时提前换新，
+                        # 避免把失败记到下一封邮件头上
+                        try:
+                            server.noop()
+                        except smtplib.SMTPServerDisconnected:
+                            server.close()
+                            server = _connect_smtp(config)
+                            sent_on_conn = 0
+
+                    server.sendmail(
+                        config.username, [addr], _patch_to_header(base_bytes, addr)
+                    )
+                    sent_on_conn += 1
+                except smtplib.SMTPRecipientsRefused as e:
+                    error_info = (f"收件人被拒绝: {str(e)}", "SMTP_ERROR")
+                except smtplib.SMTPServerDisconnected as e:
+                    # 连接被服务器断开：close() 直接丢弃（跳过 QUIT 往返），
+                    # 重连后当前邮件记为失败
+                    error_info = (f"SMTP 连接已断开: {str(e)}", "SMTP_ERROR")
+                    server.close()
+                    try:
+                        server = _connect_smtp(config)
+                    except Exception as conn_e:
+                        conn_error = str(conn_e)
+                    sent_on_conn = 0
+                except smtplib.SMTPException as e:
+                    error_info = (f"SMTP 错误: {str(e)}", "SMTP_ERROR")
+                except Exception as e:
+                    # 轮换 / 探活重连失败：当前邮件尚未发送，记为连接错误
+                    error_info = (f"连接 SMTP 服务器失败: {str(e)}", "SMTP_CONNECTION_ERROR")
+                    conn_error = str(e)
+
+                for index in unique[addr]:
+                    results[index] = SendResult(
+                        recipient=recipients[index],
+                        success=error_info is None,
+                        error=error_info[0] if error_info else None,
+                        code=error_info[1] if error_info else None
+                    )
+
+                if conn_error is not None:
+                    for rest in send_list[pos + 1:]:
+                        for index in unique[rest]:
+                            results[index] = SendResult(
+                                recipient=recipients[index],
+                                success=False,
+                                error=f"连接 SMTP 服务器失败: {conn_error}",
+                                code="SMTP_CONNECTION_ERROR"
+                            )
+                    break
+        finally:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+        return _bulk_summary(results)
 
+    except Exception as e:
         return {
-            "success": failed == 0,
-            "total": len(recipients),
-            "succeeded": succeeded,
-            "failed": failed,
-            "results": results
+            "success": False,
+            "error": str(e),
+            "error_code": "UNEXPECTED_ERROR"
         }
 
+
+async def send_bulk_email_async(
+    recipients: List[str],
+    subject: str,
+    body: str,
+    body_type: str = "plain",
+    concurrency: int = 15
+) -> Dict[str, Any]:
+    """
+    异步批量发送邮件（基于可选依赖 aiosmtplib）
+
+    单个事件循环线程通过 epoll 同时驱动多条 TLS 连接，每个并发槽位
+    持有一条持久连接并从队列领取收件人，连接 / 认证成本被整个批次摊薄。
+    相比线程池方案，单封在途邮件的内存开销更低，适合已运行在 asyncio
+    宿主中的超大批量发送（数百收件人以上）。
+
+    Args:
+        recipients: 收件人邮箱地址列表
+        subject: 邮件主题
+        body: 邮件正文内容
+        body_type: 邮件正文类型，"plain" 或 "html"，默认 "plain"
+        concurrency: 并发连接数，默认 15
+
+    Returns:
+        与 send_bulk_email 相同结构的结果字典。
+        未安装 aiosmtplib 时返回 MISSING_DEPENDENCY 错误。
+    """
+    try:
+        import aiosmtplib
+    except ImportError:
+        return {
+            "success": False,
+            "error": "异步发送需要安装可选依赖 aiosmtplib",
+            "error_code": "MISSING_DEPENDENCY"
+        }
+
+    import asyncio
+
+    try:
+        # 验证参数（与 send_bulk_email 一致）
+        if not recipients or not isinstance(recipients, list):
+            return {
+                "success": False,
+                "error": "recipients 必须是非空列表",
+                "error_code": "INVALID_RECIPIENTS"
+            }
+
+        err = _require_nonempty_str(subject=subject, body=body)
+        if err:
+            return err
+
+        if body_type not in ["plain", "html"]:
+            return {
+                "success": False,
+                "error": "body_type 必须是 'plain' 或 'html'",
+                "error_code": "INVALID_BODY_TYPE"
+            }
+
+        try:
+            config = _smtp_config()
+        except SmtpConfigError as e:
+            return e.error
+
+        try:
+            attachment_parts = _build_attachment_parts()
+        except _AttachmentError as e:
+            return {
+                "success": False,
+                "error": f"处理附件失败 ({e.file_name}): {str(e)}",
+                "error_code": "ATTACHMENT_ERROR"
+            }
+
+        # 地址清洗与去重（与 send_bulk_email 共用同一套规则）
+        results, unique = _normalize_recipients(recipients)
+
+        send_list = list(unique)
+        if not send_list:
+            return _bulk_summary(results)
+
+        pending: "asyncio.Queue[str]" = asyncio.Queue()
+        for addr in send_list:
+            pending.put_nowait(addr)
+
+        async def _worker() -> Optional[Exception]:
+            """持有一条连接，循环从队列领取收件人直到取空
+
+            连接 / 认证失败以返回值上报而不是抛出：异常一旦逃出
+            gather，其余 worker 会带着队列里的收件人在后台继续投递，
+            调用方拿到整批失败的返回后重试就会重复发送。
+            """
+            client = aiosmtplib.SMTP(
+                hostname=config.host,
+                port=config.port,
+                use_tls=not config.use_tls,
+                start_tls=config.use_tls
+            )
+            try:
+                await client.connect()
+                await client.login(config.username, config.password)
+            except Exception as e:
+                return e
+            try:
+                while True:
+                    try:
+                        addr = pending.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+
+                    error_info = None
+                    try:
+                        msg = _build_message(
+                            from_addr=config.username,
+                            to=addr,
+                            subject=subject,
+                            body=body,
+                            body_type=body_type,
+                            attachments=attachment_parts
+                        )
+                        await client.send_message(msg)
+                    except aiosmtplib.SMTPException as e:
+                        error_info = (f"SMTP 错误: {str(e)}", "SMTP_ERROR")
+                    except Exception as e:
+                        # 单封失败（连接重置、构建出错等）只影响当前收件人，
+                        # 不能让异常逃出 gather 取消其余 worker
+                        error_info = (f"发送失败: {str(e)}", "SMTP_ERROR")
+
+                    for index in unique[addr]:
+                        results[index] = SendResult(
+                            recipient=recipients[index],
+                            success=error_info is None,
+                            error=error_info[0] if error_info else None,
+                            code=error_info[1] if error_info else None
+                        )
+            finally:
+                try:
+                    await client.quit()
+                except Exception:
+                    pass
+            return None
+
+        worker_excs = [
+            exc for exc in await asyncio.gather(*[
+                _worker() for _ in range(min(concurrency, len(send_list)))
+            ])
+            if exc is not None
+        ]
+
+        if worker_excs:
+            auth_exc = next(
+                (e for e in worker_excs
+                 if isinstance(e, aiosmtplib.SMTPAuthenticationError)),
+                None
+            )
+            if auth_exc is not None:
+                exc_error = "SMTP 认证失败，请检查用户名和密码"
+                exc_code = "SMTP_AUTH_ERROR"
+            else:
+                exc_error = f"连接 SMTP 服务器失败: {str(worker_excs[0])}"
+                exc_code = "SMTP_CONNECTION_ERROR"
+
+            if pending.qsize() == len(send_list):
+                # 所有 worker 都没连上：与同步路径一致，整批报连接错误
+                return {
+                    "success": False,
+                    "error": exc_error,
+                    "error_code": exc_code
+                }
+
+            # 存活的 worker 正常会清空队列；保险起见把仍滞留的
+            # 收件人标记为失败，不能丢结果
+            while True:
+                try:
+                    addr = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                for index in unique[addr]:
+                    results[index] = SendResult(
+                        recipient=recipients[index],
+                        success=False,
+                        error=exc_error,
+                        code=exc_code
+                    )
+
+        return _bulk_summary(results)
+
     except Exception as e:
         return {
             "success": False,
@@ -314,203 +1325,129 @@ def send_bulk_email(
         }
 
 
-# 预定义的 HTML 模板
-EMAIL_TEMPLATES = {
-    "notification": """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6;
-               color: #333; margin: 0; padding: 0; background-color: #f4f4f4; }}
-        .container {{ max-width: 600px; margin: 20px auto; background: #ffffff; border-radius: 10px;
-                      box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }}
-        .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white;
-                   padding: 30px; text-align: center; }}
-        .header h1 {{ margin: 0; font-size: 28px; font-weight: 600; }}
-        .content {{ padding: 30px; }}
-        .content h2 {{ color: #667eea; margin-top: 0; }}
-        .message {{ background: #f8f9fa; padding: 20px; border-left: 4px solid #667eea;
-                    border-radius: 5px; margin: 20px 0; }}
-        .footer {{ background: #f8f9fa; padding: 20px; text-align: center; color: #666;
-                   font-size: 14px; border-top: 1px solid #e0e0e0; }}
-        .button {{ display: inline-block; padding: 12px 30px; background: #667eea; color: white;
-                   text-decoration: none; border-radius: 5px; margin: 20px 0; font-weight: 600; }}
-        .button:hover {{ background: #5568d3; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📢 {title}</h1>
-        </div>
-        <div class="content">
-            <h2>{heading}</h2>
-            <div class="message">
-                {message}
-            </div>
-            {button_html}
-            {extra_content}
-        </div>
-        <div class="footer">
-            {footer}
-        </div>
-    </div>
-</body>
-</html>
-""",
-    "welcome": """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6;
-               color: #333; margin: 0; padding: 0; background-color: #f4f4f4; }}
-        .container {{ max-width: 600px; margin: 20px auto; background: #ffffff; border-radius: 10px;
-                      box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }}
-        .header {{ background: linear-gradient(135deg, #43e97b 0%, #38f9d7 100%); color: white;
-                   padding: 40px; text-align: center; }}
-        .header h1 {{ margin: 0; font-size: 32px; font-weight: 600; }}
-        .welcome-icon {{ font-size: 60px; margin-bottom: 10px; }}
-        .content {{ padding: 30px; }}
-        .welcome-message {{ font-size: 18px; margin: 20px 0; color: #555; }}
-        .features {{ background: #f8f9fa; padding: 20px; border-radius: 5px; margin: 20px 0; }}
-        .feature-item {{ margin: 10px 0; padding-left: 25px; position: relative; }}
-        .feature-item:before {{ content: "✓"; position: absolute; left: 0; color: #43e97b;
-                                font-weight: bold; }}
-        .button {{ display: inline-block; padding: 15px 40px; background: #43e97b; color: white;
-                   text-decoration: none; border-radius: 5px; margin: 20px 0; font-weight: 600;
-                   font-size: 16px; }}
-        .button:hover {{ background: #3bd66f; }}
-        .footer {{ background: #f8f9fa; padding: 20px; text-align: center; color: #666;
-                   font-size: 14px; border-top: 1px solid #e0e0e0; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div class="welcome-icon">🎉</div>
-            <h1>{title}</h1>
-        </div>
-        <div class="content">
-            <div class="welcome-message">
-                {message}
-            </div>
-            {features_html}
-            {button_html}
-            {extra_content}
-        </div>
-        <div class="footer">
-            {footer}
-        </div>
-    </div>
-</body>
-</html>
-""",
-    "alert": """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6;
-               color: #333; margin: 0; padding: 0; background-color: #f4f4f4; }}
-        .container {{ max-width: 600px; margin: 20px auto; background: #ffffff; border-radius: 10px;
-                      box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }}
-        .header {{ background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); color: white;
-                   padding: 30px; text-align: center; }}
-        .header h1 {{ margin: 0; font-size: 28px; font-weight: 600; }}
-        .alert-icon {{ font-size: 60px; margin-bottom: 10px; }}
-        .content {{ padding: 30px; }}
-        .alert-box {{ background: #fff3cd; border-left: 4px solid #f5576c; padding: 20px;
-                      border-radius: 5px; margin: 20px 0; }}
-        .alert-title {{ color: #f5576c; font-weight: 600; font-size: 18px; margin-bottom: 10px; }}
-        .details {{ background: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-        .button {{ display: inline-block; padding: 12px 30px; background: #f5576c; color: white;
-                   text-decoration: none; border-radius: 5px; margin: 20px 0; font-weight: 600; }}
-        .button:hover {{ background: #e04656; }}
-        .footer {{ background: #f8f9fa; padding: 20px; text-align: center; color: #666;
-                   font-size: 14px; border-top: 1px solid #e0e0e0; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div class="alert-icon">⚠️</div>
-            <h1>{title}</h1>
-        </div>
-        <div class="content">
-            <div class="alert-box">
-                <div class="alert-title">{alert_title}</div>
-                <div>{message}</div>
-            </div>
-            {details_html}
-            {button_html}
-            {extra_content}
-        </div>
-        <div class="footer">
-            {footer}
-        </div>
-    </div>
-</body>
-</html>
-""",
-    "report": """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6;
-               color: #333; margin: 0; padding: 0; background-color: #f4f4f4; }}
-        .container {{ max-width: 600px; margin: 20px auto; background: #ffffff; border-radius: 10px;
-                      box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }}
-        .header {{ background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%); color: white;
-                   padding: 30px; text-align: center; }}
-        .header h1 {{ margin: 0; font-size: 28px; font-weight: 600; }}
-        .content {{ padding: 30px; }}
-        .summary {{ background: #f8f9fa; padding: 20px; border-radius: 5px; margin: 20px 0; }}
-        .summary-title {{ color: #4facfe; font-weight: 600; font-size: 18px; margin-bottom: 15px; }}
-        .stats {{ display: flex; flex-wrap: wrap; gap: 10px; margin: 20px 0; }}
-        .stat-card {{ flex: 1; min-width: 150px; background: white; border: 2px solid #e0e0e0;
-                      border-radius: 5px; padding: 15px; text-align: center; }}
-        .stat-value {{ font-size: 32px; font-weight: 600; color: #4facfe; }}
-        .stat-label {{ color: #666; font-size: 14px; margin-top: 5px; }}
-        .button {{ display: inline-block; padding: 12px 30px; background: #4facfe; color: white;
-                   text-decoration: none; border-radius: 5px; margin: 20px 0; font-weight: 600; }}
-        .button:hover {{ background: #3d9ee6; }}
-        .footer {{ background: #f8f9fa; padding: 20px; text-align: center; color: #666;
-                   font-size: 14px; border-top: 1px solid #e0e0e0; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📊 {title}</h1>
-        </div>
-        <div class="content">
-            <div class="summary">
-                <div class="summary-title">{summary_title}</div>
-                {message}
-            </div>
-            {stats_html}
-            {button_html}
-            {extra_content}
-        </div>
-        <div class="footer">
-            {footer}
-        </div>
-    </div>
-</body>
-</html>
-"""
-}
+# 预定义的 HTML 模板存放在 src/templates/ 下，按需懒加载：
+# 只用 send_email 的调用方不再为模板字符串付出导入和驻留内存成本，
+# 文件通过只读 mmap 读取，多个 worker 进程共享同一份内核页缓存。
+_TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+
+def _convert_placeholders(template: str) -> str:
+    """
+    把 `{name}` 占位符转换为 %-格式的 `%(name)s`
+
+    字面量 `%`（CSS 渐变中的百分比）转义为 `%%`；CSS 字面量花括号
+    （`{ ... }`，花括号内含空格 / 冒号）不匹配占位符模式，保持原样。
+    %-格式化在 C 层单趟完成，没有 str.format 的花括号转义状态机。
+    """
+    return re.sub(r'\{(\w+)\}', r'%(\1)s', template.replace('%', '%%'))
+
+
+# %-格式占位符，用于把模板切成常量片段和变量引用
+_PFMT_RE = re.compile(r'%\((\w+)\)s')
+
+
+def _compile_template(name: str, template: str):
+    """
+    把 %-格式模板 AOT 编译成 Python 渲染函数
+
+    加载时一次性切分常量片段和变量名，生成只做 ''.join 拼接的函数
+    源码并 compile/exec；之后每次渲染按片段拼接，不再对整段模板
+    做占位符扫描。常量片段作为元组闭包传入，源码里只有下标引用。
+    """
+    literals: List[str] = []
+    exprs: List[str] = []
+    pos = 0
+    for match in _PFMT_RE.finditer(template):
+        # 字面量片段里的 %% 还原为 %（加载时已做过转义）
+        literals.append(template[pos:match.start()].replace('%%', '%'))
+        exprs.append(f"_lit[{len(literals) - 1}]")
+        exprs.append(f"v[{match.group(1)!r}]")
+        pos = match.end()
+    literals.append(template[pos:].replace('%%', '%'))
+    exprs.append(f"_lit[{len(literals) - 1}]")
+
+    source = (
+        "def _render(v, _lit=_lit):\n"
+        f"    return ''.join(({', '.join(exprs)}))\n"
+    )
+    namespace: Dict[str, Any] = {"_lit": tuple(literals)}
+    exec(compile(source, f"<template:{name}>", "exec"), namespace)
+    return namespace["_render"]
+
+
+class _TemplateStore:
+    """
+    HTML 邮件模板的懒加载存储
+
+    首次访问某个模板时才从磁盘读取（只读 mmap + MADV_WILLNEED 预取），
+    编译成专用的渲染函数缓存在进程内；后续渲染只做片段拼接。
+    """
+
+    _KEYS = ("notification", "welcome", "alert", "report")
+
+    def __init__(self, directory: Path):
+        self._dir = directory
+        self._cache: Dict[str, str] = {}
+        self._renderers: Dict[str, Any] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._KEYS
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._KEYS
+
+    def _load(self, key: str) -> str:
+        path = self._dir / f"{key}.html"
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, 'MADV_WILLNEED'):
+                    mm.madvise(mmap.MADV_WILLNEED)
+                return mm[:].decode('utf-8')
+
+    def get_template(self, key: str) -> str:
+        tmpl = self._cache.get(key)
+        if tmpl is None:
+            tmpl = _convert_placeholders(self._load(key))
+            self._cache[key] = tmpl
+        return tmpl
+
+    def render(self, key: str, template_vars: Dict[str, str]) -> str:
+        """用 AOT 编译好的渲染函数填充模板"""
+        fn = self._renderers.get(key)
+        if fn is None:
+            fn = _compile_template(key, self.get_template(key))
+            self._renderers[key] = fn
+        return fn(template_vars)
+
+    def preload(self) -> None:
+        """
+        在多进程 worker fork 之前预热全部模板
+
+        父进程里先把四个模板读入并转换好，子进程通过 COW 直接继承
+        现成的模板字符串（模板对象只读，几乎不会触发页复制）；
+        磁盘上的模板文件本身经由只读 mmap 读取，各 worker 共享
+        同一份内核页缓存，不会按进程重复占用内存。
+        """
+        for key in self._KEYS:
+            self.get_template(key)
+
+
+EMAIL_TEMPLATES = _TemplateStore(_TEMPLATES_DIR)
+
+# 模板文本字段及其默认值：渲染前统一做一次 HTML 转义
+_TEMPLATE_TEXT_FIELDS = (
+    ("title", ""),
+    ("heading", ""),
+    ("message", ""),
+    ("alert_title", "重要提示"),
+    ("summary_title", "摘要"),
+    ("footer", "此邮件由系统自动发送，请勿回复。"),
+)
+
+# 列表区块的固定包裹标签（避免每次渲染重复分配字面量）
+_FEATURES_WRAP = ('<div class="features">', '</div>')
+_DETAILS_WRAP = ('<div class="details">', '</div>')
+_STATS_WRAP = ('<div class="stats">', '</div>')
 
 
 def send_email_with_template(
@@ -613,19 +1550,9 @@ def send_email_with_template(
     """
     try:
         # 验证参数
-        if not to or not isinstance(to, str):
-            return {
-                "success": False,
-                "error": "收件人地址 (to) 必须是非空字符串",
-                "error_code": "INVALID_RECIPIENT"
-            }
-
-        if not subject or not isinstance(subject, str):
-            return {
-                "success": False,
-                "error": "邮件主题 (subject) 必须是非空字符串",
-                "error_code": "INVALID_SUBJECT"
-            }
+        err = _require_nonempty_str(to=to, subject=subject)
+        if err:
+            return err
 
         if template_type not in EMAIL_TEMPLATES:
             return {
@@ -641,61 +1568,63 @@ def send_email_with_template(
                 "error_code": "INVALID_TEMPLATE_DATA"
             }
 
-        # 准备模板变量
+        # 准备模板变量：文本字段统一做一次 HTML 转义，
+        # 用户数据中的 < & 等字符不会破坏邮件版式；
+        # extra_content 作为受信任的原始 HTML 保留
         template_vars = {
-            "title": template_data.get("title", ""),
-            "heading": template_data.get("heading", ""),
-            "message": template_data.get("message", ""),
-            "alert_title": template_data.get("alert_title", "重要提示"),
-            "summary_title": template_data.get("summary_title", "摘要"),
-            "extra_content": template_data.get("extra_content", ""),
-            "footer": template_data.get("footer", "此邮件由系统自动发送，请勿回复。")
+            key: _escape_html(str(template_data.get(key, default)))
+            for key, default in _TEMPLATE_TEXT_FIELDS
         }
+        template_vars["extra_content"] = template_data.get("extra_content", "")
 
-        # 处理按钮
+        # 处理按钮（链接和文字也转义后再拼入受信任的 button_html）
         button_html = ""
         if template_data.get("button_text") and template_data.get("button_url"):
-            button_html = f'<a href="{template_data["button_url"]}" class="button">{template_data["button_text"]}</a>'
+            button_html = (
+                f'<a href="{_escape_html(str(template_data["button_url"]))}" class="button">'
+                f'{_escape_html(str(template_data["button_text"]))}</a>'
+            )
         template_vars["button_html"] = button_html
 
-        # 处理特定模板的特殊字段
+        # 处理特定模板的特殊字段（list + join 拼接，避免 O(n²) 的字符串累加）
         if template_type == "welcome" and template_data.get("features"):
-            features = template_data["features"]
-            features_html = '<div class="features">'
-            for feature in features:
-                features_html += f'<div class="feature-item">{feature}</div>'
-            features_html += '</div>'
-            template_vars["features_html"] = features_html
+            parts = [_FEATURES_WRAP[0]]
+            parts.extend(
+                f'<div class="feature-item">{_escape_html(str(feature))}</div>'
+                for feature in template_data["features"]
+            )
+            parts.append(_FEATURES_WRAP[1])
+            template_vars["features_html"] = ''.join(parts)
         else:
             template_vars["features_html"] = ""
 
         if template_type == "alert" and template_data.get("details"):
-            details = template_data["details"]
-            details_html = '<div class="details">'
-            for key, value in details.items():
-                details_html += f'<div><strong>{key}:</strong> {value}</div>'
-            details_html += '</div>'
-            template_vars["details_html"] = details_html
+            parts = [_DETAILS_WRAP[0]]
+            parts.extend(
+                f'<div><strong>{_escape_html(str(key))}:</strong> {_escape_html(str(value))}</div>'
+                for key, value in template_data["details"].items()
+            )
+            parts.append(_DETAILS_WRAP[1])
+            template_vars["details_html"] = ''.join(parts)
         else:
             template_vars["details_html"] = ""
 
         if template_type == "report" and template_data.get("stats"):
-            stats = template_data["stats"]
-            stats_html = '<div class="stats">'
-            for stat in stats:
-                stats_html += f'''
-                <div class="stat-card">
-                    <div class="stat-value">{stat.get("value", "N/A")}</div>
-                    <div class="stat-label">{stat.get("label", "")}</div>
-                </div>
-                '''
-            stats_html += '</div>'
-            template_vars["stats_html"] = stats_html
+            parts = [_STATS_WRAP[0]]
+            parts.extend(
+                f'<div class="stat-card">'
+                f'<div class="stat-value">{_escape_html(str(stat.get("value", "N/A")))}</div>'
+                f'<div class="stat-label">{_escape_html(str(stat.get("label", "")))}</div>'
+                f'</div>'
+                for stat in template_data["stats"]
+            )
+            parts.append(_STATS_WRAP[1])
+            template_vars["stats_html"] = ''.join(parts)
         else:
             template_vars["stats_html"] = ""
 
-        # 渲染模板
-        html_body = EMAIL_TEMPLATES[template_type].format(**template_vars)
+        # 渲染模板（首次访问时从磁盘懒加载并转换，之后是单趟 % 替换）
+        html_body = EMAIL_TEMPLATES.render(template_type, template_vars)
 
         # 使用 send_email 发送（附件会自动从 data/inputs/attachments/ 读取）
         result = send_email(
@@ -0,0 +1,65 @@
+"""
+测试共享夹具
+
+smtplib.SMTP / SMTP_SSL 只在模块级 patch 一次，所有测试共享同一个
+桩连接对象：patcher 的安装 / 拆除（遍历 sys.modules、重绑定属性）
+在约 20 个测试间摊销，而不是每个测试各付一次。
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from tests.smtp_stub import SMTPFactoryStub, SMTPStub
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _smtp_env():
+    """会话级设置 SMTP 环境变量，整个测试会话只写一次 os.environ
+
+    个别需要不同配置的测试（SSL、非法端口、缺失配置）用函数级
+    monkeypatch 覆盖或删除相应键即可。
+    """
+    mp = pytest.MonkeyPatch()
+    mp.setenv("SMTP_HOST", "smtp.example.com")
+    mp.setenv("SMTP_PORT", "587")
+    mp.setenv("SMTP_USERNAME", "test@example.com")
+    mp.setenv("SMTP_PASSWORD", "test-password")
+    mp.setenv("SMTP_USE_TLS", "true")
+    yield
+    mp.undo()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _smtp_patch():
+    """模块级 patch smtplib.SMTP / SMTP_SSL，两者返回同一个桩连接"""
+    server = SMTPStub()
+    smtp = SMTPFactoryStub(server)
+    smtp_ssl = SMTPFactoryStub(server)
+    with patch('smtplib.SMTP', new=smtp), patch('smtplib.SMTP_SSL', new=smtp_ssl):
+        yield smtp, smtp_ssl, server
+
+
+@pytest.fixture(autouse=True)
+def _reset_smtp_stub(_smtp_patch):
+    """每个测试前清零计数器并撤掉注入的失败"""
+    for stub in _smtp_patch:
+        stub.reset()
+
+
+@pytest.fixture
+def mock_smtp(_smtp_patch):
+    """patch 后的 smtplib.SMTP 类桩"""
+    return _smtp_patch[0]
+
+
+@pytest.fixture
+def mock_smtp_ssl(_smtp_patch):
+    """patch 后的 smtplib.SMTP_SSL 类桩"""
+    return _smtp_patch[1]
+
+
+@pytest.fixture
+def mock_server(_smtp_patch):
+    """共享的桩 SMTP 连接对象"""
+    return _smtp_patch[2]
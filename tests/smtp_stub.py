@@ -0,0 +1,110 @@
+"""
+手写的 SMTP 连接桩
+
+Mock 的每次调用都要经过 Python 级 __call__，惰性创建子 mock 并把
+调用追加进 mock_calls 记录簿；桩类只做普通属性读写和整数自增，
+让测试断言的成本降到最低。
+"""
+
+import threading
+
+
+class SocketStub:
+    """记录写出次数和 setsockopt 调用的套接字替身"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sendall_count = 0
+        self.sent = []
+        self.setsockopt_calls = []
+
+    def sendall(self, data):
+        self.sendall_count += 1
+        self.sent.append(data)
+
+    def setsockopt(self, level, optname, value):
+        self.setsockopt_calls.append((level, optname, value))
+
+
+class SMTPStub:
+    """
+    最小可用的 smtplib.SMTP 连接替身
+
+    按方法维护整数计数器；login_exc / sendmail_hook 用于注入失败，
+    replies 用于喂给流水线路径的 getreply。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sock = SocketStub()
+        self.reset()
+
+    def reset(self):
+        self.starttls_count = 0
+        self.login_count = 0
+        self.send_message_count = 0
+        self.sendmail_count = 0
+        self.noop_count = 0
+        self.quit_count = 0
+        self.close_count = 0
+        self.login_exc = None
+        self.sendmail_hook = None
+        self.esmtp_features = {}
+        self.replies = []
+        self.sock.reset()
+
+    def starttls(self):
+        self.starttls_count += 1
+
+    def login(self, username, password):
+        self.login_count += 1
+        if self.login_exc is not None:
+            raise self.login_exc
+
+    def send_message(self, msg, from_addr=None, to_addrs=None):
+        self.send_message_count += 1
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        # 并行路径下多个线程共用同一个桩，计数需要加锁
+        with self._lock:
+            self.sendmail_count += 1
+        if self.sendmail_hook is not None:
+            self.sendmail_hook(from_addr, to_addrs, msg)
+
+    def noop(self):
+        self.noop_count += 1
+
+    def getreply(self):
+        return self.replies.pop(0)
+
+    def quit(self):
+        with self._lock:
+            self.quit_count += 1
+
+    def close(self):
+        self.close_count += 1
+
+
+class SMTPFactoryStub:
+    """
+    smtplib.SMTP / SMTP_SSL 类的替身
+
+    被调用（即「建立连接」）时自增计数并返回共享的 SMTPStub。
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.call_count = 0
+
+    def reset(self):
+        self.call_count = 0
+
+    @property
+    def called(self):
+        return self.call_count > 0
+
+    def __call__(self, *args, **kwargs):
+        self.call_count += 1
+        return self.server
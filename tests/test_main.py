@@ -4,8 +4,10 @@
 测试所有暴露给 AI 的函数，确保它们按预期工作。
 """
 
+import asyncio
 import os
-from unittest.mock import Mock, patch
+import sys
+import types
 
 import pytest
 
@@ -15,15 +17,6 @@ from src.main import send_bulk_email, send_email
 class TestSendEmail:
     """测试单封邮件发送功能"""
 
-    @pytest.fixture
-    def smtp_env(self, monkeypatch):
-        """设置 SMTP 环境变量"""
-        monkeypatch.setenv("SMTP_HOST", "smtp.example.com")
-        monkeypatch.setenv("SMTP_PORT", "587")
-        monkeypatch.setenv("SMTP_USERNAME", "test@example.com")
-        monkeypatch.setenv("SMTP_PASSWORD", "test-password")
-        monkeypatch.setenv("SMTP_USE_TLS", "true")
-
     def test_send_email_missing_config(self, monkeypatch):
         """测试缺少 SMTP 配置"""
         # 清除所有 SMTP 环境变量
@@ -43,58 +36,24 @@ class TestSendEmail:
         assert "missing_configs" in result
         assert len(result["missing_configs"]) == 4
 
-    def test_send_email_invalid_recipient(self, smtp_env):
-        """测试无效的收件人"""
-        result = send_email(
-            to="",
-            subject="Test",
-            body="Test body"
-        )
-
-        assert result["success"] is False
-        assert result["error_code"] == "INVALID_RECIPIENT"
-
-    def test_send_email_invalid_subject(self, smtp_env):
-        """测试无效的主题"""
-        result = send_email(
-            to="user@example.com",
-            subject="",
-            body="Test body"
-        )
-
-        assert result["success"] is False
-        assert result["error_code"] == "INVALID_SUBJECT"
+    @pytest.mark.parametrize("overrides, error_code", [
+        ({"to": ""}, "INVALID_RECIPIENT"),
+        ({"subject": ""}, "INVALID_SUBJECT"),
+        ({"body": ""}, "INVALID_BODY"),
+        ({"body_type": "markdown"}, "INVALID_BODY_TYPE"),
+    ])
+    def test_send_email_invalid_input(self, overrides, error_code):
+        """测试各类非法入参"""
+        kwargs = {"to": "user@example.com", "subject": "Test", "body": "Test body"}
+        kwargs.update(overrides)
 
-    def test_send_email_invalid_body(self, smtp_env):
-        """测试无效的正文"""
-        result = send_email(
-            to="user@example.com",
-            subject="Test",
-            body=""
-        )
-
-        assert result["success"] is False
-        assert result["error_code"] == "INVALID_BODY"
-
-    def test_send_email_invalid_body_type(self, smtp_env):
-        """测试无效的正文类型"""
-        result = send_email(
-            to="user@example.com",
-            subject="Test",
-            body="Test body",
-            body_type="markdown"
-        )
+        result = send_email(**kwargs)
 
         assert result["success"] is False
-        assert result["error_code"] == "INVALID_BODY_TYPE"
+        assert result["error_code"] == error_code
 
-    @patch('smtplib.SMTP')
-    def test_send_email_success_plain(self, mock_smtp, smtp_env):
+    def test_send_email_success_plain(self, mock_server):
         """测试成功发送纯文本邮件"""
-        # Mock SMTP 服务器
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email(
             to="user@example.com",
             subject="Test Email",
@@ -104,17 +63,13 @@ class TestSendEmail:
         assert result["success"] is True
         assert result["message"] == "邮件发送成功"
         assert result["recipients"] == ["user@example.com"]
-        assert mock_server.starttls.called
-        assert mock_server.login.called
-        assert mock_server.send_message.called
-        assert mock_server.quit.called
+        assert mock_server.starttls_count == 1
+        assert mock_server.login_count == 1
+        assert mock_server.send_message_count == 1
+        assert mock_server.quit_count == 1
 
-    @patch('smtplib.SMTP')
-    def test_send_email_success_html(self, mock_smtp, smtp_env):
+    def test_send_email_success_html(self):
         """测试成功发送 HTML 邮件"""
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email(
             to="user@example.com",
             subject="Test Email",
@@ -125,12 +80,8 @@ class TestSendEmail:
         assert result["success"] is True
         assert result["message"] == "邮件发送成功"
 
-    @patch('smtplib.SMTP')
-    def test_send_email_with_cc_bcc(self, mock_smtp, smtp_env):
+    def test_send_email_with_cc_bcc(self):
         """测试带抄送和密送的邮件"""
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email(
             to="user1@example.com",
             subject="Test Email",
@@ -144,12 +95,8 @@ class TestSendEmail:
         assert result["cc"] == ["user2@example.com", "user3@example.com"]
         assert result["bcc_count"] == 1
 
-    @patch('smtplib.SMTP')
-    def test_send_email_multiple_recipients(self, mock_smtp, smtp_env):
+    def test_send_email_multiple_recipients(self):
         """测试多个收件人"""
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email(
             to="user1@example.com,user2@example.com,user3@example.com",
             subject="Test Email",
@@ -162,8 +109,7 @@ class TestSendEmail:
         assert "user2@example.com" in result["recipients"]
         assert "user3@example.com" in result["recipients"]
 
-    @patch('smtplib.SMTP_SSL')
-    def test_send_email_with_ssl(self, mock_smtp_ssl, monkeypatch):
+    def test_send_email_with_ssl(self, mock_smtp_ssl, mock_server, monkeypatch):
         """测试使用 SSL 连接"""
         monkeypatch.setenv("SMTP_HOST", "smtp.example.com")
         monkeypatch.setenv("SMTP_PORT", "465")
@@ -171,9 +117,6 @@ class TestSendEmail:
         monkeypatch.setenv("SMTP_PASSWORD", "test-password")
         monkeypatch.setenv("SMTP_USE_TLS", "false")
 
-        mock_server = Mock()
-        mock_smtp_ssl.return_value = mock_server
-
         result = send_email(
             to="user@example.com",
             subject="Test Email",
@@ -183,14 +126,42 @@ class TestSendEmail:
         assert result["success"] is True
         assert mock_smtp_ssl.called
         # SSL 不需要 starttls
-        assert not mock_server.starttls.called
+        assert mock_server.starttls_count == 0
+
+    def test_send_email_sets_tcp_nodelay(self, mock_server):
+        """测试连接后禁用 Nagle 并放大发送缓冲"""
+        import socket
+
+        result = send_email(
+            to="user@example.com",
+            subject="Test Email",
+            body="Test body"
+        )
+
+        assert result["success"] is True
+        opts = mock_server.sock.setsockopt_calls
+        assert (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) in opts
+        assert (socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20) in opts
+
+    def test_send_email_io_uring_fallback(self, mock_server, monkeypatch):
+        """测试 io_uring 开关打开但依赖缺失时回退到普通套接字"""
+        monkeypatch.setenv("SMTP_IO_URING", "true")
+        monkeypatch.setitem(sys.modules, "liburing", None)
+
+        original_sock = mock_server.sock
+        result = send_email(
+            to="user@example.com",
+            subject="Test Email",
+            body="Test body"
+        )
 
-    @patch('smtplib.SMTP')
-    def test_send_email_auth_error(self, mock_smtp, smtp_env):
+        assert result["success"] is True
+        # liburing 不可用：套接字未被包装
+        assert mock_server.sock is original_sock
+
+    def test_send_email_auth_error(self, mock_server):
         """测试认证失败"""
-        mock_server = Mock()
-        mock_server.login.side_effect = Exception("Authentication failed")
-        mock_smtp.return_value = mock_server
+        mock_server.login_exc = Exception("Authentication failed")
 
         result = send_email(
             to="user@example.com",
@@ -221,54 +192,27 @@ class TestSendEmail:
 class TestSendBulkEmail:
     """测试批量邮件发送功能"""
 
-    @pytest.fixture
-    def smtp_env(self, monkeypatch):
-        """设置 SMTP 环境变量"""
-        monkeypatch.setenv("SMTP_HOST", "smtp.example.com")
-        monkeypatch.setenv("SMTP_PORT", "587")
-        monkeypatch.setenv("SMTP_USERNAME", "test@example.com")
-        monkeypatch.setenv("SMTP_PASSWORD", "test-password")
-        monkeypatch.setenv("SMTP_USE_TLS", "true")
-
-    def test_send_bulk_email_invalid_recipients(self, smtp_env):
-        """测试无效的收件人列表"""
-        result = send_bulk_email(
-            recipients=[],
-            subject="Test",
-            body="Test body"
-        )
-
-        assert result["success"] is False
-        assert result["error_code"] == "INVALID_RECIPIENTS"
-
-    def test_send_bulk_email_invalid_subject(self, smtp_env):
-        """测试无效的主题"""
-        result = send_bulk_email(
-            recipients=["user@example.com"],
-            subject="",
-            body="Test body"
-        )
-
-        assert result["success"] is False
-        assert result["error_code"] == "INVALID_SUBJECT"
-
-    def test_send_bulk_email_invalid_body(self, smtp_env):
-        """测试无效的正文"""
-        result = send_bulk_email(
-            recipients=["user@example.com"],
-            subject="Test",
-            body=""
-        )
+    @pytest.mark.parametrize("overrides, error_code", [
+        ({"recipients": []}, "INVALID_RECIPIENTS"),
+        ({"subject": ""}, "INVALID_SUBJECT"),
+        ({"body": ""}, "INVALID_BODY"),
+    ])
+    def test_send_bulk_email_invalid_input(self, overrides, error_code):
+        """测试各类非法入参"""
+        kwargs = {
+            "recipients": ["user@example.com"],
+            "subject": "Test",
+            "body": "Test body"
+        }
+        kwargs.update(overrides)
+
+        result = send_bulk_email(**kwargs)
 
         assert result["success"] is False
-        assert result["error_code"] == "INVALID_BODY"
+        assert result["error_code"] == error_code
 
-    @patch('smtplib.SMTP')
-    def test_send_bulk_email_success(self, mock_smtp, smtp_env):
+    def test_send_bulk_email_success(self, mock_smtp, mock_server):
         """测试批量发送成功"""
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         recipients = [
             "user1@example.com",
             "user2@example.com",
@@ -291,24 +235,21 @@ class TestSendBulkEmail:
             assert r["success"] is True
             assert r["recipient"] in recipients
 
-    @patch('src.main.send_email')
-    def test_send_bulk_email_partial_failure(self, mock_send_email, smtp_env):
+        # 整个批次只建立一次连接，逐封复用
+        assert mock_smtp.call_count == 1
+        assert mock_server.sendmail_count == 3
+        assert mock_server.quit_count == 1
+
+    def test_send_bulk_email_partial_failure(self, mock_server):
         """测试部分失败的批量发送"""
+        import smtplib
+
         # 模拟第二封邮件发送失败
-        def side_effect(to, subject, body, body_type):
-            if to == "user2@example.com":
-                return {
-                    "success": False,
-                    "error": "SMTP error",
-                    "error_code": "SMTP_ERROR"
-                }
-            return {
-                "success": True,
-                "message": "邮件发送成功",
-                "recipients": [to]
-            }
+        def sendmail_hook(from_addr, to_addrs, msg):
+            if "user2@example.com" in to_addrs:
+                raise smtplib.SMTPException("SMTP error")
 
-        mock_send_email.side_effect = side_effect
+        mock_server.sendmail_hook = sendmail_hook
 
         recipients = [
             "user1@example.com",
@@ -327,17 +268,154 @@ class TestSendBulkEmail:
         assert result["succeeded"] == 2
         assert result["failed"] == 1
 
-        # 检查结果详情
-        failed_results = [r for r in result["results"] if not r["success"]]
-        assert len(failed_results) == 1
-        assert failed_results[0]["recipient"] == "user2@example.com"
+        # 失败索引：收件人 -> 错误码，无需扫描结果列表
+        assert result["failed_recipients"] == {"user2@example.com": "SMTP_ERROR"}
 
-    @patch('smtplib.SMTP')
-    def test_send_bulk_email_html(self, mock_smtp, smtp_env):
-        """测试批量发送 HTML 邮件"""
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
+    def test_send_bulk_email_reconnect_failure_keeps_results(self, mock_server):
+        """测试断连后重连失败时保留已发结果，剩余记为连接错误"""
+        import smtplib
+
+        # 第二封触发断连，同时让重连时的 login 失败
+        def sendmail_hook(from_addr, to_addrs, msg):
+            if "user2@example.com" in to_addrs:
+                mock_server.login_exc = smtplib.SMTPException("server gone")
+                raise smtplib.SMTPServerDisconnected("connection lost")
+
+        mock_server.sendmail_hook = sendmail_hook
+
+        result = send_bulk_email(
+            recipients=["user1@example.com", "user2@example.com", "user3@example.com"],
+            subject="Bulk Test",
+            body="Test body"
+        )
+
+        # 不能退化成整批 UNEXPECTED_ERROR：第一封的成功结果要保留
+        assert result["total"] == 3
+        assert result["succeeded"] == 1
+        assert result["failed_recipients"] == {
+            "user2@example.com": "SMTP_ERROR",
+            "user3@example.com": "SMTP_CONNECTION_ERROR",
+        }
+
+    def test_send_bulk_email_rotates_connection(self, mock_smtp, mock_server):
+        """测试达到单连接上限后轮换连接"""
+        recipients = [f"user{i}@example.com" for i in range(5)]
+
+        result = send_bulk_email(
+            recipients=recipients,
+            subject="Bulk Test",
+            body="Test body",
+            max_per_connection=2
+        )
+
+        assert result["success"] is True
+        assert result["succeeded"] == 5
+        # 每发满 2 封重建一次连接：共 3 条连接、3 次 quit
+        assert mock_smtp.call_count == 3
+        assert mock_server.quit_count == 3
+
+    def test_send_bulk_email_pipelining(self, mock_server):
+        """测试服务器声明 PIPELINING 时合并信封命令"""
+        mock_server.esmtp_features = {"pipelining": ""}
+        # 每封邮件依次应答 MAIL / RCPT / DATA / 正文
+        mock_server.replies = [
+            (250, b"ok"), (250, b"ok"), (354, b"send data"), (250, b"ok"),
+            (250, b"ok"), (250, b"ok"), (354, b"send data"), (250, b"ok"),
+        ]
 
+        result = send_bulk_email(
+            recipients=["user1@example.com", "user2@example.com"],
+            subject="Bulk Test",
+            body="Test body"
+        )
+
+        assert result["success"] is True
+        assert result["succeeded"] == 2
+        # 信封三条命令合并为一次写出：每封 2 次 sendall（信封 + 正文）
+        assert mock_server.sock.sendall_count == 4
+        assert mock_server.sendmail_count == 0
+
+    def test_send_bulk_email_pipelining_disconnect_recovery(
+        self, monkeypatch, mock_smtp, mock_server
+    ):
+        """测试流水线路径中途断连时重连并继续发剩余收件人"""
+        import smtplib
+
+        # 第 1 封完整应答；第 2 封首个应答即断连；重连后第 3 封成功
+        script = iter([
+            (250, b"ok"), (250, b"ok"), (354, b"send data"), (250, b"ok"),
+            smtplib.SMTPServerDisconnected("connection lost"),
+            (250, b"ok"), (250, b"ok"), (354, b"send data"), (250, b"ok"),
+        ])
+
+        def getreply():
+            item = next(script)
+            if isinstance(item, Exception):
+                raise item
+            return item
+
+        mock_server.esmtp_features = {"pipelining": ""}
+        monkeypatch.setattr(mock_server, "getreply", getreply)
+
+        result = send_bulk_email(
+            recipients=["user1@example.com", "user2@example.com", "user3@example.com"],
+            subject="Bulk Test",
+            body="Test body"
+        )
+
+        # 断连只影响当前这封，之前和之后的结果都保留
+        assert result["total"] == 3
+        assert result["succeeded"] == 2
+        assert result["failed_recipients"] == {"user2@example.com": "SMTP_ERROR"}
+        assert mock_smtp.call_count == 2
+
+    def test_send_bulk_email_parallel_pool(self, mock_smtp, mock_server):
+        """测试大批量自动切换为连接池并行发送"""
+        recipients = [f"user{i}@example.com" for i in range(25)]
+
+        result = send_bulk_email(
+            recipients=recipients,
+            subject="Bulk Test",
+            body="Test body",
+            pool_size=5
+        )
+
+        assert result["success"] is True
+        assert result["succeeded"] == 25
+        # 并行模式建立 pool_size 条连接，收件人分摊到各连接上
+        assert mock_smtp.call_count == 5
+        assert mock_server.sendmail_count == 25
+        assert mock_server.quit_count == 5
+
+    def test_send_bulk_email_prebuilt_bytes(self, mock_server):
+        """测试批次复用同一份序列化字节，仅替换 To 头"""
+        captured = []
+
+        def sendmail_hook(from_addr, to_addrs, msg):
+            captured.append((to_addrs, msg))
+
+        mock_server.sendmail_hook = sendmail_hook
+
+        result = send_bulk_email(
+            recipients=["user1@example.com", "user2@example.com"],
+            subject="Bulk Test",
+            body="Test body"
+        )
+
+        assert result["success"] is True
+        payloads = []
+        for to_addrs, raw in captured:
+            assert isinstance(raw, bytes)
+            # 每封邮件以各自的 To 头开头
+            to_line, _, rest = raw.partition(b"\r\n")
+            assert to_line == b"To: " + to_addrs[0].encode()
+            payloads.append(rest)
+
+        # To 头之后是同一份预序列化的邮件字节
+        assert payloads[0] == payloads[1]
+
+    def test_send_bulk_email_html(self):
+        """测试批量发送 HTML 邮件"""
         result = send_bulk_email(
             recipients=["user1@example.com", "user2@example.com"],
             subject="HTML Test",
@@ -350,19 +428,255 @@ class TestSendBulkEmail:
         assert result["succeeded"] == 2
 
 
+class TestSendBulkEmailAsync:
+    """测试异步批量邮件发送功能"""
+
+    def test_send_bulk_email_async_missing_dependency(self, monkeypatch):
+        """测试未安装 aiosmtplib 时返回依赖缺失错误"""
+        from src.main import send_bulk_email_async
+
+        # sys.modules 里的 None 会让 import aiosmtplib 抛 ImportError
+        monkeypatch.setitem(sys.modules, "aiosmtplib", None)
+
+        result = asyncio.run(send_bulk_email_async(
+            recipients=["user@example.com"],
+            subject="Test",
+            body="Test body"
+        ))
+
+        assert result["success"] is False
+        assert result["error_code"] == "MISSING_DEPENDENCY"
+
+    def test_send_bulk_email_async_success(self, monkeypatch):
+        """测试异步批量发送成功（注入假的 aiosmtplib 模块）"""
+        from src.main import send_bulk_email_async
+
+        counters = {"connect": 0, "send": 0, "quit": 0}
+
+        class FakeSMTP:
+            def __init__(self, hostname=None, port=None,
+                         use_tls=False, start_tls=False):
+                pass
+
+            async def connect(self):
+                counters["connect"] += 1
+
+            async def login(self, username, password):
+                pass
+
+            async def send_message(self, msg):
+                counters["send"] += 1
+
+            async def quit(self):
+                counters["quit"] += 1
+
+        fake = types.ModuleType("aiosmtplib")
+        fake.SMTP = FakeSMTP
+        fake.SMTPException = type("SMTPException", (Exception,), {})
+        fake.SMTPAuthenticationError = type(
+            "SMTPAuthenticationError", (fake.SMTPException,), {}
+        )
+        monkeypatch.setitem(sys.modules, "aiosmtplib", fake)
+
+        result = asyncio.run(send_bulk_email_async(
+            recipients=[f"user{i}@example.com" for i in range(3)],
+            subject="Bulk Test",
+            body="Test body",
+            concurrency=2
+        ))
+
+        assert result["success"] is True
+        assert result["succeeded"] == 3
+        # 每个并发槽位一条持久连接，批次结束各自 quit
+        assert counters["connect"] == 2
+        assert counters["send"] == 3
+        assert counters["quit"] == 2
+
+    def test_send_bulk_email_async_connect_failure_survivors_finish(self, monkeypatch):
+        """测试部分 worker 连接失败时由存活 worker 发完，不整批报错"""
+        from src.main import send_bulk_email_async
+
+        counters = {"connect": 0, "send": 0}
+
+        class FakeSMTP:
+            def __init__(self, hostname=None, port=None,
+                         use_tls=False, start_tls=False):
+                pass
+
+            async def connect(self):
+                counters["connect"] += 1
+                # 第二条连接被拒（如触发服务商并发连接上限）
+                if counters["connect"] == 2:
+                    raise OSError("connection refused")
+
+            async def login(self, username, password):
+                pass
+
+            async def send_message(self, msg):
+                counters["send"] += 1
+
+            async def quit(self):
+                pass
+
+        fake = types.ModuleType("aiosmtplib")
+        fake.SMTP = FakeSMTP
+        fake.SMTPException = type("SMTPException", (Exception,), {})
+        fake.SMTPAuthenticationError = type(
+            "SMTPAuthenticationError", (fake.SMTPException,), {}
+        )
+        monkeypatch.setitem(sys.modules, "aiosmtplib", fake)
+
+        result = asyncio.run(send_bulk_email_async(
+            recipients=[f"user{i}@example.com" for i in range(3)],
+            subject="Bulk Test",
+            body="Test body",
+            concurrency=2
+        ))
+
+        # 返回前队列已清空：结果完整，没有 worker 留在后台补发
+        assert result["success"] is True
+        assert result["succeeded"] == 3
+        assert counters["send"] == 3
+
+    def test_send_bulk_email_async_connect_failure_all(self, monkeypatch):
+        """测试所有 worker 都连不上时整批报连接错误且一封未发"""
+        from src.main import send_bulk_email_async
+
+        counters = {"send": 0}
+
+        class FakeSMTP:
+            def __init__(self, hostname=None, port=None,
+                         use_tls=False, start_tls=False):
+                pass
+
+            async def connect(self):
+                raise OSError("connection refused")
+
+            async def login(self, username, password):
+                pass
+
+            async def send_message(self, msg):
+                counters["send"] += 1
+
+            async def quit(self):
+                pass
+
+        fake = types.ModuleType("aiosmtplib")
+        fake.SMTP = FakeSMTP
+        fake.SMTPException = type("SMTPException", (Exception,), {})
+        fake.SMTPAuthenticationError = type(
+            "SMTPAuthenticationError", (fake.SMTPException,), {}
+        )
+        monkeypatch.setitem(sys.modules, "aiosmtplib", fake)
+
+        result = asyncio.run(send_bulk_email_async(
+            recipients=[f"user{i}@example.com" for i in range(3)],
+            subject="Bulk Test",
+            body="Test body",
+            concurrency=2
+        ))
+
+        assert result["success"] is False
+        assert result["error_code"] == "SMTP_CONNECTION_ERROR"
+        assert counters["send"] == 0
+
+    def test_send_bulk_email_async_partial_failure(self, monkeypatch):
+        """测试异步路径非 SMTP 异常只影响当前收件人"""
+        from src.main import send_bulk_email_async
+
+        class FakeSMTP:
+            def __init__(self, hostname=None, port=None,
+                         use_tls=False, start_tls=False):
+                pass
+
+            async def connect(self):
+                pass
+
+            async def login(self, username, password):
+                pass
+
+            async def send_message(self, msg):
+                # 非 aiosmtplib.SMTPException 的异常（如连接被重置）
+                if msg["To"] == "user2@example.com":
+                    raise ConnectionResetError("peer reset")
+
+            async def quit(self):
+                pass
+
+        fake = types.ModuleType("aiosmtplib")
+        fake.SMTP = FakeSMTP
+        fake.SMTPException = type("SMTPException", (Exception,), {})
+        fake.SMTPAuthenticationError = type(
+            "SMTPAuthenticationError", (fake.SMTPException,), {}
+        )
+        monkeypatch.setitem(sys.modules, "aiosmtplib", fake)
+
+        result = asyncio.run(send_bulk_email_async(
+            recipients=["user1@example.com", "user2@example.com", "user3@example.com"],
+            subject="Bulk Test",
+            body="Test body",
+            concurrency=1
+        ))
+
+        # 不能取消其余 worker 把整批记为连接错误
+        assert result["total"] == 3
+        assert result["succeeded"] == 2
+        assert result["failed_recipients"] == {"user2@example.com": "SMTP_ERROR"}
+
+    def test_send_bulk_email_async_normalizes_recipients(self, monkeypatch):
+        """测试异步路径与同步路径共用地址清洗 / 去重规则"""
+        from src.main import send_bulk_email_async
+
+        sent = []
+
+        class FakeSMTP:
+            def __init__(self, hostname=None, port=None,
+                         use_tls=False, start_tls=False):
+                pass
+
+            async def connect(self):
+                pass
+
+            async def login(self, username, password):
+                pass
+
+            async def send_message(self, msg):
+                sent.append(msg["To"])
+
+            async def quit(self):
+                pass
+
+        fake = types.ModuleType("aiosmtplib")
+        fake.SMTP = FakeSMTP
+        fake.SMTPException = type("SMTPException", (Exception,), {})
+        fake.SMTPAuthenticationError = type(
+            "SMTPAuthenticationError", (fake.SMTPException,), {}
+        )
+        monkeypatch.setitem(sys.modules, "aiosmtplib", fake)
+
+        result = asyncio.run(send_bulk_email_async(
+            recipients=[
+                " user1@example.com ",
+                "user1@EXAMPLE.com",
+                "not-an-email",
+                "user2@example.com",
+            ],
+            subject="Bulk Test",
+            body="Test body",
+            concurrency=1
+        ))
+
+        # 去重后只发两封；非法地址不占用 SMTP 往返
+        assert sent == ["user1@example.com", "user2@example.com"]
+        assert result["total"] == 4
+        assert result["succeeded"] == 3
+        assert result["failed_recipients"] == {"not-an-email": "INVALID_ADDRESS"}
+
+
 class TestSendEmailWithTemplate:
     """测试模板邮件发送功能"""
 
-    @pytest.fixture
-    def smtp_env(self, monkeypatch):
-        """设置 SMTP 环境变量"""
-        monkeypatch.setenv("SMTP_HOST", "smtp.example.com")
-        monkeypatch.setenv("SMTP_PORT", "587")
-        monkeypatch.setenv("SMTP_USERNAME", "test@example.com")
-        monkeypatch.setenv("SMTP_PASSWORD", "test-password")
-        monkeypatch.setenv("SMTP_USE_TLS", "true")
-
-    def test_send_template_email_invalid_recipient(self, smtp_env):
+    def test_send_template_email_invalid_recipient(self):
         """测试无效的收件人"""
         from src.main import send_email_with_template
 
@@ -376,7 +690,7 @@ class TestSendEmailWithTemplate:
         assert result["success"] is False
         assert result["error_code"] == "INVALID_RECIPIENT"
 
-    def test_send_template_email_invalid_template_type(self, smtp_env):
+    def test_send_template_email_invalid_template_type(self):
         """测试无效的模板类型"""
         from src.main import send_email_with_template
 
@@ -390,7 +704,7 @@ class TestSendEmailWithTemplate:
         assert result["success"] is False
         assert result["error_code"] == "INVALID_TEMPLATE_TYPE"
 
-    def test_send_template_email_invalid_template_data(self, smtp_env):
+    def test_send_template_email_invalid_template_data(self):
         """测试无效的模板数据"""
         from src.main import send_email_with_template
 
@@ -404,14 +718,10 @@ class TestSendEmailWithTemplate:
         assert result["success"] is False
         assert result["error_code"] == "INVALID_TEMPLATE_DATA"
 
-    @patch('smtplib.SMTP')
-    def test_send_notification_template(self, mock_smtp, smtp_env):
+    def test_send_notification_template(self, mock_server):
         """测试发送通知模板邮件"""
         from src.main import send_email_with_template
 
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email_with_template(
             to="user@example.com",
             subject="系统通知",
@@ -427,16 +737,12 @@ class TestSendEmailWithTemplate:
 
         assert result["success"] is True
         assert result["template_type"] == "notification"
-        assert mock_server.send_message.called
+        assert mock_server.send_message_count == 1
 
-    @patch('smtplib.SMTP')
-    def test_send_welcome_template(self, mock_smtp, smtp_env):
+    def test_send_welcome_template(self):
         """测试发送欢迎模板邮件"""
         from src.main import send_email_with_template
 
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email_with_template(
             to="user@example.com",
             subject="欢迎加入",
@@ -453,14 +759,10 @@ class TestSendEmailWithTemplate:
         assert result["success"] is True
         assert result["template_type"] == "welcome"
 
-    @patch('smtplib.SMTP')
-    def test_send_alert_template(self, mock_smtp, smtp_env):
+    def test_send_alert_template(self):
         """测试发送警告模板邮件"""
         from src.main import send_email_with_template
 
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email_with_template(
             to="user@example.com",
             subject="安全警告",
@@ -481,14 +783,10 @@ class TestSendEmailWithTemplate:
         assert result["success"] is True
         assert result["template_type"] == "alert"
 
-    @patch('smtplib.SMTP')
-    def test_send_report_template(self, mock_smtp, smtp_env):
+    def test_send_report_template(self):
         """测试发送报告模板邮件"""
         from src.main import send_email_with_template
 
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email_with_template(
             to="user@example.com",
             subject="月度报告",
@@ -510,14 +808,10 @@ class TestSendEmailWithTemplate:
         assert result["success"] is True
         assert result["template_type"] == "report"
 
-    @patch('smtplib.SMTP')
-    def test_send_template_with_cc_bcc(self, mock_smtp, smtp_env):
+    def test_send_template_with_cc_bcc(self):
         """测试发送带抄送和密送的模板邮件"""
         from src.main import send_email_with_template
 
-        mock_server = Mock()
-        mock_smtp.return_value = mock_server
-
         result = send_email_with_template(
             to="user@example.com",
             subject="通知",
@@ -534,3 +828,59 @@ class TestSendEmailWithTemplate:
         assert result["success"] is True
         assert result["cc"] == ["manager@example.com"]
         assert result["bcc_count"] == 1
+
+    def test_send_template_email_explicit_empty_field(self, monkeypatch):
+        """测试显式传入的空字符串字段不回退到默认值"""
+        from src.main import EMAIL_TEMPLATES, send_email_with_template
+
+        rendered = {}
+        original_render = EMAIL_TEMPLATES.render
+
+        def capturing_render(key, variables):
+            rendered.update(variables)
+            return original_render(key, variables)
+
+        monkeypatch.setattr(EMAIL_TEMPLATES, "render", capturing_render)
+
+        result = send_email_with_template(
+            to="user@example.com",
+            subject="通知",
+            template_type="notification",
+            template_data={
+                "title": "通知",
+                "heading": "重要通知",
+                "message": "内容",
+                "footer": ""
+            }
+        )
+
+        assert result["success"] is True
+        # footer 显式传空字符串：不应被「此邮件由系统自动发送」默认值覆盖
+        assert rendered["footer"] == ""
+
+    def test_template_compiled_once(self, monkeypatch):
+        """测试模板在进程内只加载、转换一次"""
+        from src.main import EMAIL_TEMPLATES, _TemplateStore, send_email_with_template
+
+        load_counts = {"n": 0}
+        original_load = _TemplateStore._load
+
+        def counting_load(store, key):
+            load_counts["n"] += 1
+            return original_load(store, key)
+
+        monkeypatch.setattr(_TemplateStore, "_load", counting_load)
+        # 清空缓存，从冷状态验证
+        monkeypatch.setattr(EMAIL_TEMPLATES, "_cache", {})
+        monkeypatch.setattr(EMAIL_TEMPLATES, "_renderers", {})
+
+        for _ in range(3):
+            result = send_email_with_template(
+                to="user@example.com",
+                subject="通知",
+                template_type="notification",
+                template_data={"title": "通知", "message": "内容"}
+            )
+            assert result["success"] is True
+
+        assert load_counts["n"] == 1